@@ -0,0 +1,61 @@
+"""
+Import-time benchmark for the pipeline modules.
+
+Each module is imported in a fresh interpreter (python -X importtime), so
+the numbers match what a cold serverless or queue worker pays. Run from
+the repository root:
+
+    python benchmarks/import_time.py --runs 20
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+MODULES = (
+    "dsa.hash.pipeline_metrics",
+    "dsa.hash.serialization",
+    "dsa.hash.shopping_carts",
+    "dsa.hash.search_warehouse",
+)
+# must never be paid for by a bare import
+HEAVY = ("numpy", "orjson", "msgspec", "multiprocessing", "concurrent.futures",
+         "argparse", "cProfile", "tracemalloc", "json")
+
+
+def import_time_us(module: str) -> int:
+    """Cumulative import time of module in microseconds, from -X importtime."""
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                          cwd=ROOT, capture_output=True, text=True, check=True)
+    for line in proc.stderr.splitlines():
+        fields = [f.strip() for f in line.split("|")]
+        if len(fields) == 3 and fields[2] == module:
+            return int(fields[1])
+    raise RuntimeError(f"{module} not found in -X importtime output")
+
+
+def heavy_modules_loaded(module: str) -> list:
+    code = (f"import sys, {module}; "
+            f"print(','.join(m for m in {HEAVY!r} if m in sys.modules))")
+    proc = subprocess.run([sys.executable, "-c", code], cwd=ROOT,
+                          capture_output=True, text=True, check=True)
+    return [m for m in proc.stdout.strip().split(",") if m]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args()
+
+    print(f"{'module':32} {'p50 ms':>8} {'max ms':>8}  heavy imports")
+    for module in MODULES:
+        samples = [import_time_us(module) / 1000 for _ in range(args.runs)]
+        heavy = heavy_modules_loaded(module)
+        print(f"{module:32} {statistics.median(samples):8.2f} {max(samples):8.2f}  "
+              f"{', '.join(heavy) or '-'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+"""
+Opt-in instrumentation for the shopping carts pricing pipeline.
+
+The batch stages (load_data, simulate_dequeued_data, agregate_results_by_id)
+are wrapped with `stage`. While the registry is disabled the wrapper is a
+single attribute check plus the original call, so it is safe to leave
+compiled in production and switch on with `enable()` or with the
+ARCA_METRICS=1 environment variable. The per item discount_rule is not
+wrapped; agregate_results_by_id times it only while metrics are enabled.
+
+When enabled we keep, per stage:
+- calls, total seconds, carts and items seen (carts/sec and items/sec)
+- per cart latency samples (p50/p99), bounded so memory does not grow
+- bytes read (only load_data reports it)
+- allocation peaks of every N-th call (opt-in): tracemalloc is started
+  just for that call and stopped again, so the calls in between run at
+  full speed, but each sampled call runs several times slower. A stage
+  running inside another sampled stage is not sampled, so the outer peak
+  is not reset
+
+Results are exported as Prometheus text format or JSON. `profiled` dumps a
+cProfile stats file; the wrappers use functools.wraps so stage names stay
+readable in cProfile, snakeviz and py-spy output. json, cProfile and
+tracemalloc are only imported once they are actually used.
+"""
+import functools
+import math
+import os
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Any, Callable, Deque, Dict, Iterator, Optional, Tuple
+
+if TYPE_CHECKING:
+    import cProfile
+
+METRIC_PREFIX = "arca_pipeline"
+
+
+class StageStats:
+    """Counters and latency samples for a single pipeline stage."""
+
+    def __init__(self, name: str, max_samples: int = 10000):
+        self.name = name
+        self.calls = 0
+        self.seconds = 0.0
+        self.carts = 0
+        self.items = 0
+        self.bytes_read = 0
+        self.alloc_samples = 0
+        self.alloc_peak_bytes = 0
+        self.cart_seconds: Deque[float] = deque(maxlen=max_samples)
+
+    def percentile(self, pct: float) -> float:
+        """Nearest-rank percentile of the per cart latency samples."""
+        if not self.cart_seconds:
+            return 0.0
+        ordered = sorted(self.cart_seconds)
+        rank = math.ceil(pct / 100.0 * len(ordered)) - 1
+        return ordered[min(max(rank, 0), len(ordered) - 1)]
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "seconds": self.seconds,
+            "carts": self.carts,
+            "items": self.items,
+            "carts_per_second": self.carts / self.seconds if self.seconds else 0.0,
+            "items_per_second": self.items / self.seconds if self.seconds else 0.0,
+            "cart_p50_seconds": self.percentile(50),
+            "cart_p99_seconds": self.percentile(99),
+            "bytes_read": self.bytes_read,
+            "alloc_samples": self.alloc_samples,
+            "alloc_peak_bytes": self.alloc_peak_bytes,
+        }
+
+
+class MetricsRegistry:
+    """
+      Holds the stage stats and the on/off switch.
+      `enabled` is a plain attribute so the disabled path stays cheap.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.alloc_sample_every = 0
+        self.max_samples = 10000
+        self.stages: Dict[str, StageStats] = {}
+        self.sampling_alloc = False
+
+    def enable(self, alloc_sample_every: int = 0, max_samples: int = 10000) -> None:
+        """
+          Start collecting. alloc_sample_every=N traces allocations during
+          every N-th call of a stage only (0 never touches tracemalloc).
+          Keep N large in production: a traced call is several times slower.
+        """
+        self.alloc_sample_every = alloc_sample_every
+        self.max_samples = max_samples
+        self.enabled = True
+
+    def disable(self) -> None:
+        self.enabled = False
+        self.alloc_sample_every = 0
+
+    def reset(self) -> None:
+        self.stages.clear()
+
+    def drain(self) -> Dict[str, StageStats]:
+        """Hand over the collected stages and start empty (used by worker processes)."""
+        stages, self.stages = self.stages, {}
+        return stages
+
+    def merge(self, stages: Dict[str, StageStats]) -> None:
+        """Fold stage stats collected elsewhere, e.g. in a worker process, into this registry."""
+        for name, other in stages.items():
+            stats = self.get(name)
+            stats.calls += other.calls
+            stats.seconds += other.seconds
+            stats.carts += other.carts
+            stats.items += other.items
+            stats.bytes_read += other.bytes_read
+            stats.alloc_samples += other.alloc_samples
+            stats.alloc_peak_bytes = max(stats.alloc_peak_bytes, other.alloc_peak_bytes)
+            stats.cart_seconds.extend(other.cart_seconds)
+
+    def get(self, name: str) -> StageStats:
+        stats = self.stages.get(name)
+        if stats is None:
+            stats = self.stages[name] = StageStats(name, self.max_samples)
+        return stats
+
+    def observe_cart(self, name: str, seconds: float) -> None:
+        self.get(name).cart_seconds.append(seconds)
+
+    def add_bytes(self, name: str, nbytes: int) -> None:
+        self.get(name).bytes_read += nbytes
+
+    def add_calls(self, name: str, calls: int, seconds: float) -> None:
+        """Record calls timed by the caller (for stages too hot to wrap)."""
+        stats = self.get(name)
+        stats.calls += calls
+        stats.seconds += seconds
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        return {name: stats.as_dict() for name, stats in self.stages.items()}
+
+    def to_json(self) -> str:
+        import json
+        return json.dumps({"stages": self.snapshot()}, indent=2, sort_keys=True)
+
+    def to_prometheus(self) -> str:
+        """Render every stage in the Prometheus text exposition format."""
+        snapshot = self.snapshot()
+        lines = []
+        for field in StageStats("").as_dict():
+            metric = f"{METRIC_PREFIX}_{_PROMETHEUS_NAMES.get(field, field)}"
+            kind = "counter" if field in _PROMETHEUS_NAMES else "gauge"
+            lines.append(f"# TYPE {metric} {kind}")
+            for name, values in snapshot.items():
+                lines.append(f'{metric}{{stage="{name}"}} {values[field]}')
+        return "\n".join(lines) + "\n"
+
+    def write_json(self, path: str) -> None:
+        _atomic_write(path, self.to_json())
+
+    def write_prometheus(self, path: str) -> None:
+        _atomic_write(path, self.to_prometheus())
+
+
+# counters get the _total suffix Prometheus/OpenMetrics expects
+_PROMETHEUS_NAMES = {
+    "calls": "calls_total",
+    "seconds": "seconds_total",
+    "carts": "carts_total",
+    "items": "items_total",
+    "bytes_read": "read_bytes_total",
+    "alloc_samples": "alloc_samples_total",
+}
+
+REGISTRY = MetricsRegistry()
+
+
+def _atomic_write(path: str, text: str) -> None:
+    # node_exporter's textfile collector may read while we write
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+def count_carts(payload: Any) -> Tuple[int, int]:
+    """Return (carts, items) for a {"carts": [...]} payload or a list of carts."""
+    carts = payload.get("carts", []) if isinstance(payload, dict) else payload
+    if not isinstance(carts, list):
+        return 0, 0
+    items = 0
+    for cart in carts:
+        if isinstance(cart, dict):
+            cart_items = cart.get("items")
+            if isinstance(cart_items, list):
+                items += len(cart_items)
+    return len(carts), items
+
+
+def stage(name: str, counter: Optional[Callable[[Any], Tuple[int, int]]] = count_carts,
+          registry: MetricsRegistry = REGISTRY) -> Callable:
+    """
+      Decorator that times a pipeline stage.
+      counter extracts (carts, items) from the stage result; pass None for
+      stages where only calls/time matter.
+    """
+    def decorator(fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not registry.enabled:
+                return fn(*args, **kwargs)
+            stats = registry.get(name)
+            stats.calls += 1
+            sample_alloc = (registry.alloc_sample_every
+                            and not registry.sampling_alloc
+                            and stats.calls % registry.alloc_sample_every == 0)
+            if sample_alloc:
+                import tracemalloc
+                registry.sampling_alloc = True
+                # trace only this call; a session started by the caller is
+                # reused and left running
+                started_tracing = not tracemalloc.is_tracing()
+                if started_tracing:
+                    tracemalloc.start()
+                else:
+                    tracemalloc.reset_peak()
+                base, _ = tracemalloc.get_traced_memory()
+            start = time.perf_counter()
+            try:
+                result = fn(*args, **kwargs)
+            finally:
+                stats.seconds += time.perf_counter() - start
+                if sample_alloc:
+                    _, peak = tracemalloc.get_traced_memory()
+                    if started_tracing:
+                        tracemalloc.stop()
+                    registry.sampling_alloc = False
+                    stats.alloc_samples += 1
+                    stats.alloc_peak_bytes = max(stats.alloc_peak_bytes, peak - base)
+            if counter is not None:
+                carts, items = counter(result)
+                stats.carts += carts
+                stats.items += items
+            return result
+        return wrapper
+    return decorator
+
+
+def enable(alloc_sample_every: int = 0, max_samples: int = 10000) -> None:
+    REGISTRY.enable(alloc_sample_every=alloc_sample_every, max_samples=max_samples)
+
+
+def disable() -> None:
+    REGISTRY.disable()
+
+
+@contextmanager
+def profiled(path: str) -> Iterator["cProfile.Profile"]:
+    """
+      Run the block under cProfile and dump stats to path
+      (open with `python -m pstats path` or snakeviz).
+    """
+    import cProfile
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
+
+
+def env_int(name: str, default: int = 0) -> int:
+    # runs at import time, so a bad value must not break importing the pipeline
+    try:
+        return max(int(os.environ.get(name, default)), 0)
+    except ValueError:
+        return default
+
+
+if os.environ.get("ARCA_METRICS", "").lower() in ("1", "true", "yes"):
+    enable(alloc_sample_every=env_int("ARCA_METRICS_ALLOC_EVERY"))
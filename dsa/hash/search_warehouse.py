@@ -2,7 +2,6 @@
 Problem Definition: Você trabalha no time de Logística da VTEX. Recebemos um pedido com vários itens, e temos múltiplos estoques (warehouses) espalhados pelo país. Sua missão é escrever um algoritmo que decida **de qual estoque** retirar cada item para atender o pedido."
 
 """
-import json
 from typing import Tuple, Dict, List, Any
 
 
@@ -85,60 +84,66 @@ def split_order(order: dict, inventory: dict) -> Any:
     return order_with_warehouse
 
 
-# Caso 1 (Green) temos todos os pedido no mesmo warehouse
-order_green: dict = {
-    "id": "order-123",
-    "items": [
-        {"sku": "IPHONE", "qty": 5},
-        {"sku": "CASE",   "qty": 3}
+def main() -> None:
+    """
+      Cenários red-green de demonstração; só roda via linha de comando.
+    """
+    # Caso 1 (Green) temos todos os pedido no mesmo warehouse
+    order_green: dict = {
+        "id": "order-123",
+        "items": [
+            {"sku": "IPHONE", "qty": 5},
+            {"sku": "CASE",   "qty": 3}
+        ]
+    }
+
+    inventory: List[dict] = [
+        {"warehouse_id": "SP", "stock": {"IPHONE": 3, "CASE": 5}},
+        {"warehouse_id": "RJ", "stock": {"IPHONE": 10, "CASE": 0}},
+        {"warehouse_id": "MG", "stock": {"IPHONE": 5, "CASE": 5}}  # <- MG tem tudo!
     ]
-}
 
+    order_with_warehouse = check_warehouse_stock(order=simulate_sqs_dequeue(
+        order=order_green), inventory=simulate_redis_cache(inventory=inventory))
+    print(order_with_warehouse)
+
+    # Caso 1 (RED) temos todos os pedido no mesmo warehouse
+    order_red: dict = {
+        "id": "order-123",
+        "items": [
+            {"sku": "IPHONE", "qty": 15},
+            {"sku": "CASE",   "qty": 3}
+        ]
+    }
+
+    order_with_warehouse = check_warehouse_stock(order=simulate_sqs_dequeue(
+        order=order_red), inventory=simulate_redis_cache(inventory=inventory))
+    print(order_with_warehouse)
 
-inventory: List[dict] = [
-    {"warehouse_id": "SP", "stock": {"IPHONE": 3, "CASE": 5}},
-    {"warehouse_id": "RJ", "stock": {"IPHONE": 10, "CASE": 0}},
-    {"warehouse_id": "MG", "stock": {"IPHONE": 5, "CASE": 5}}  # <- MG tem tudo!
-]
+    # Case 2 Green quando não temos todos os pedidos no warehouse
+    order_green_case2 = {"id": "o-2", "items": [{"sku": "IPHONE", "qty": 10}]}
+    inventory: List[dict] = [
+        {"warehouse_id": "SP", "stock": {"IPHONE": 3, "CASE": 5}},
+        {"warehouse_id": "RJ", "stock": {"IPHONE": 4, "CASE": 100}},
+        {"warehouse_id": "MG", "stock": {"IPHONE": 3, "CASE": 5}}  # <- MG tem tudo!
+    ]
 
-order_with_warehouse = check_warehouse_stock(order=simulate_sqs_dequeue(
-    order=order_green), inventory=simulate_redis_cache(inventory=inventory))
-print(order_with_warehouse)
+    order_with_warehouse = split_order(order=simulate_sqs_dequeue(
+        order=order_green_case2), inventory=simulate_redis_cache(inventory=inventory))
+    print(order_with_warehouse)
 
-# Caso 1 (RED) temos todos os pedido no mesmo warehouse
-order_red: dict = {
-    "id": "order-123",
-    "items": [
-        {"sku": "IPHONE", "qty": 15},
-        {"sku": "CASE",   "qty": 3}
+    # Case 2 Green quando não temos todos os pedidos no warehouse e temos 0 em uma warehouse
+    order_green_case21 = {"id": "o-2", "items": [{"sku": "IPHONE", "qty": 10}]}
+    inventory: List[dict] = [
+        {"warehouse_id": "SP", "stock": {"IPHONE": 3, "CASE": 5}},
+        {"warehouse_id": "RJ", "stock": {"IPHONE": 0, "CASE": 100}},
+        {"warehouse_id": "MG", "stock": {"IPHONE": 7, "CASE": 5}}  # <- MG tem tudo!
     ]
-}
-
-order_with_warehouse = check_warehouse_stock(order=simulate_sqs_dequeue(
-    order=order_red), inventory=simulate_redis_cache(inventory=inventory))
-print(order_with_warehouse)
-
-# Case 2 Green quando não temos todos os pedidos no warehouse
-order_green_case2 = {"id": "o-2", "items": [{"sku": "IPHONE", "qty": 10}]}
-inventory: List[dict] = [
-    {"warehouse_id": "SP", "stock": {"IPHONE": 3, "CASE": 5}},
-    {"warehouse_id": "RJ", "stock": {"IPHONE": 4, "CASE": 100}},
-    {"warehouse_id": "MG", "stock": {"IPHONE": 3, "CASE": 5}}  # <- MG tem tudo!
-]
-
-order_with_warehouse = split_order(order=simulate_sqs_dequeue(
-    order=order_green_case2), inventory=simulate_redis_cache(inventory=inventory))
-print(order_with_warehouse)
-
-
-# Case 2 Green quando não temos todos os pedidos no warehouse e temos 0 em uma warehouse
-order_green_case21 = {"id": "o-2", "items": [{"sku": "IPHONE", "qty": 10}]}
-inventory: List[dict] = [
-    {"warehouse_id": "SP", "stock": {"IPHONE": 3, "CASE": 5}},
-    {"warehouse_id": "RJ", "stock": {"IPHONE": 0, "CASE": 100}},
-    {"warehouse_id": "MG", "stock": {"IPHONE": 7, "CASE": 5}}  # <- MG tem tudo!
-]
-
-order_with_warehouse = split_order(order=simulate_sqs_dequeue(
-    order=order_green_case21), inventory=simulate_redis_cache(inventory=inventory))
-print(order_with_warehouse)
+
+    order_with_warehouse = split_order(order=simulate_sqs_dequeue(
+        order=order_green_case21), inventory=simulate_redis_cache(inventory=inventory))
+    print(order_with_warehouse)
+
+
+if __name__ == "__main__":
+    main()
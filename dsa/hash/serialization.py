@@ -0,0 +1,209 @@
+"""
+JSON encode/decode for the shopping carts pipeline.
+
+The fastest installed backend is picked the first time it is needed:
+msgspec, then orjson, then the stdlib json module. Backends, stdlib json
+included, are only imported at that point, and ARCA_JSON_BACKEND or
+`set_backend` can pin a specific one.
+
+With msgspec installed `decode_carts` decodes clean cart documents
+straight into typed structs, so type checks happen inside the decoder
+instead of in a second Python pass. Documents that do not fit the strict
+schema are left to simulate_dequeued_data, so the output never depends on
+the backend.
+
+`NDJSONWriter` writes priced carts one per line through a large in-memory
+buffer to keep write syscalls rare.
+"""
+import os
+from typing import IO, Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Union
+
+BACKENDS = ("msgspec", "orjson", "json")
+DEFAULT_BUFFER_SIZE = 1 << 20
+
+
+class Backend(NamedTuple):
+    name: str
+    loads: Callable[[Union[bytes, str]], Any]
+    dumps: Callable[[Any], bytes]
+
+
+_backend: Optional[Backend] = None
+_cart_batch_type: Any = None
+
+
+def _stdlib_dumps(obj: Any) -> bytes:
+    import json
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def _import_backend(name: str) -> Backend:
+    if name == "msgspec":
+        import msgspec
+        decoder = msgspec.json.Decoder()
+        encoder = msgspec.json.Encoder()
+        return Backend("msgspec", decoder.decode, encoder.encode)
+    if name == "orjson":
+        import orjson
+        return Backend("orjson", orjson.loads, orjson.dumps)
+    if name == "json":
+        import json
+        return Backend("json", json.loads, _stdlib_dumps)
+    raise ValueError(f"Unknown JSON backend {name!r}, expected one of {BACKENDS}")
+
+
+def set_backend(name: Optional[str] = None) -> Backend:
+    """
+      Select the JSON backend. None picks the fastest importable one;
+      an explicit name raises ImportError when it is not installed.
+    """
+    global _backend
+    if name is not None:
+        _backend = _import_backend(name)
+        return _backend
+    for candidate in BACKENDS:
+        try:
+            _backend = _import_backend(candidate)
+            return _backend
+        except ImportError:
+            continue
+    raise RuntimeError("stdlib json backend is always importable")
+
+
+def get_backend() -> Backend:
+    if _backend is None:
+        return set_backend(os.environ.get("ARCA_JSON_BACKEND") or None)
+    return _backend
+
+
+def loads(data: Union[bytes, str]) -> Any:
+    """Decode JSON; raises ValueError (or a subclass) on invalid input."""
+    return get_backend().loads(data)
+
+
+def dumps(obj: Any) -> bytes:
+    """Encode to compact UTF-8 JSON bytes."""
+    return get_backend().dumps(obj)
+
+
+def _typed_cart_batch() -> Any:
+    """Build the msgspec structs for the cart schema once, on first use."""
+    global _cart_batch_type
+    if _cart_batch_type is None:
+        import msgspec
+
+        # ids are passed through untouched, like simulate_dequeued_data does
+        class CartItem(msgspec.Struct):
+            product_id: Any = None
+            quantity: int = 0
+            unit_price: float = 0.0
+
+        class Cart(msgspec.Struct):
+            cart_id: Any = None
+            user_id: Any = None
+            id: Any = None
+            user: Any = None
+            items: List[CartItem] = []
+
+        # required, so a single cart object is not silently read as no carts
+        class CartBatch(msgspec.Struct):
+            carts: List[Cart]
+
+        _cart_batch_type = msgspec.json.Decoder(CartBatch)
+    return _cart_batch_type
+
+
+def decode_carts(data: Union[bytes, str]) -> Optional[Dict[str, Any]]:
+    """
+      Decode a {"carts": [...]} document into the normalized shape produced
+      by simulate_dequeued_data, validating types inside the decoder.
+      Returns None when the backend is not msgspec, when data is not a single
+      JSON document (e.g. NDJSON) or when it does not fit the strict schema
+      (string quantities, null fields, items given as a dict, ...); the
+      caller then falls back to load_data + simulate_dequeued_data, which
+      is lenient about all of those.
+    """
+    if get_backend().name != "msgspec":
+        return None
+    import msgspec
+    try:
+        batch = _typed_cart_batch().decode(data)
+    except msgspec.DecodeError:
+        # also covers msgspec.ValidationError (off-schema documents)
+        return None
+    return {"carts": [
+        {
+            "cart_id": cart.cart_id or cart.id,
+            "user_id": cart.user_id or cart.user,
+            "items": [
+                {"product_id": it.product_id, "quantity": it.quantity,
+                 "unit_price": it.unit_price}
+                for it in cart.items
+                if it.product_id is not None and it.quantity != 0
+            ],
+        }
+        for cart in batch.carts
+    ]}
+
+
+class NDJSONWriter:
+    """
+      Buffered newline-delimited JSON writer.
+      Encoded lines are joined in memory and written in chunks of about
+      buffer_size bytes. Accepts a path or an already open binary stream
+      (e.g. sys.stdout.buffer), which is flushed but not closed.
+    """
+
+    def __init__(self, target: Union[str, IO[bytes]], buffer_size: int = DEFAULT_BUFFER_SIZE):
+        # resolve the backend first so a backend error cannot leak the file
+        self._dumps = get_backend().dumps
+        if isinstance(target, (str, os.PathLike)):
+            # a buffered file retries partial raw writes (pipes, signals)
+            self._stream = open(target, "wb")
+            self._owns_stream = True
+        else:
+            self._stream = target
+            self._owns_stream = False
+        self._buffer_size = buffer_size
+        self._pending: List[bytes] = []
+        self._pending_bytes = 0
+        self.lines = 0
+
+    def write(self, obj: Any) -> None:
+        line = self._dumps(obj)
+        self._pending.append(line)
+        self._pending.append(b"\n")
+        self._pending_bytes += len(line) + 1
+        self.lines += 1
+        if self._pending_bytes >= self._buffer_size:
+            self.flush()
+
+    def write_many(self, objs: Iterable[Any]) -> None:
+        for obj in objs:
+            self.write(obj)
+
+    def flush(self) -> None:
+        if self._pending:
+            self._stream.write(b"".join(self._pending))
+            self._pending.clear()
+            self._pending_bytes = 0
+        self._stream.flush()
+
+    def close(self) -> None:
+        self.flush()
+        if self._owns_stream:
+            self._stream.close()
+
+    def __enter__(self) -> "NDJSONWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def write_priced_carts(target: Union[str, IO[bytes]], priced: Dict[str, Any],
+                       buffer_size: int = DEFAULT_BUFFER_SIZE) -> int:
+    """Write every cart of an agregate_results_by_id result as one NDJSON line."""
+    with NDJSONWriter(target, buffer_size=buffer_size) as writer:
+        writer.write_many(priced.get("carts", []))
+    return writer.lines
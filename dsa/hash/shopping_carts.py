@@ -1,7 +1,17 @@
-import json
-from typing import Any, List, Dict, Tuple
+import os
+import sys
+import time
+from typing import (IO, TYPE_CHECKING, Any, List, Dict, Iterable, Iterator,
+                    Optional, Tuple, Union)
 
+from dsa.hash import pipeline_metrics, serialization
+from dsa.hash.pipeline_metrics import stage
 
+if TYPE_CHECKING:
+    import argparse
+
+
+@stage("load_data")
 def load_data(file_path: str) -> Any:
     """Load JSON data from a file and return a Python object.
 
@@ -12,6 +22,9 @@ def load_data(file_path: str) -> Any:
 
     If the file is empty, returns an empty list.
 
+    Parsing goes through dsa.hash.serialization, so orjson/msgspec are used
+    when installed and stdlib json otherwise.
+
     Args:
         file_path: path to the input file
 
@@ -19,30 +32,72 @@ def load_data(file_path: str) -> Any:
         Parsed JSON as Python data structures (dict, list, etc.)
 
     Raises:
-        json.JSONDecodeError: when the file contains invalid JSON and cannot be parsed as NDJSON.
+        ValueError: when the file contains invalid JSON and cannot be parsed as NDJSON
+            (json.JSONDecodeError on the stdlib backend).
     """
     p = file_path
-    with open(p, "r", encoding="utf-8") as f:
-        text = f.read()
+    with open(p, "rb") as f:
+        data = f.read()
+    if pipeline_metrics.REGISTRY.enabled:
+        pipeline_metrics.REGISTRY.add_bytes("load_data", len(data))
+
+    return _parse_document(data)
 
-    if not text.strip():
+
+def _parse_document(data: bytes) -> Any:
+    if not data.strip():
         return []
 
     # First, try to parse whole-file JSON (object or array)
     try:
-        parsed = json.loads(text)
+        parsed = serialization.loads(data)
         return parsed
-    except json.JSONDecodeError:
+    except ValueError:
         # Fallback: try NDJSON (one JSON object per non-empty line)
         objs: List[Any] = []
-        for ln in text.splitlines():
+        for ln in data.splitlines():
             ln = ln.strip()
             if not ln:
                 continue
-            objs.append(json.loads(ln))
+            objs.append(serialization.loads(ln))
         return objs
 
 
+@stage("load_carts")
+def load_carts(file_path: str) -> Dict[str, Any]:
+    """
+      Load and normalize a {"carts": [...]} file in one step.
+      On the msgspec backend the cart schema is decoded into typed structs,
+      so validation happens inside the decoder; other backends fall back
+      to load_data + simulate_dequeued_data.
+    """
+    with open(file_path, "rb") as f:
+        data = f.read()
+    if pipeline_metrics.REGISTRY.enabled:
+        pipeline_metrics.REGISTRY.add_bytes("load_carts", len(data))
+    return _decode_carts(data)
+
+
+def _decode_carts(data: bytes) -> Dict[str, Any]:
+    if not data.strip():
+        return {"carts": []}
+    carts = serialization.decode_carts(data)
+    if carts is None:
+        parsed = _parse_document(data)
+        if isinstance(parsed, list):
+            # NDJSON or a bare array of carts
+            parsed = {"carts": parsed}
+        elif isinstance(parsed, dict) and "carts" not in parsed:
+            # a single cart object
+            parsed = {"carts": [parsed]}
+        elif not isinstance(parsed, dict):
+            raise ValueError(
+                "expected a cart, a list of carts or a {\"carts\": [...]} object")
+        carts = simulate_dequeued_data(parsed)
+    return carts
+
+
+@stage("simulate_dequeued_data")
 def simulate_dequeued_data(carts) -> List:
     """
     Simple normalizer for an iterable of carts.
@@ -118,6 +173,7 @@ def discount_rule(quantity: int, unity_price: float) -> float:
     return discount
 
 
+@stage("agregate_results_by_id")
 def agregate_results_by_id(cart: List[dict]) -> Dict[str, dict]:
     """
       Agregate product by cart, item and sku
@@ -127,8 +183,13 @@ def agregate_results_by_id(cart: List[dict]) -> Dict[str, dict]:
 
     carts = cart.get("carts", [])
     result = {"carts": []}
+    timed = pipeline_metrics.REGISTRY.enabled
+    discount_calls = 0
+    discount_seconds = 0.0
 
     for cart in carts:
+        if timed:
+            started = time.perf_counter()
         aggregated = {}
         for item in cart.get("items", []):
             sku = item.get("product_id")
@@ -143,7 +204,15 @@ def agregate_results_by_id(cart: List[dict]) -> Dict[str, dict]:
         for (pid, up), info in aggregated.items():
             qty = info["quantity"]
             upf = info["unit_price"]
-            discount = discount_rule(quantity=qty, unity_price=upf)
+            if timed:
+                # discount_rule runs per item, so it is timed here instead of
+                # being wrapped with @stage
+                discount_started = time.perf_counter()
+                discount = discount_rule(quantity=qty, unity_price=upf)
+                discount_seconds += time.perf_counter() - discount_started
+                discount_calls += 1
+            else:
+                discount = discount_rule(quantity=qty, unity_price=upf)
             total_price = round((qty * upf) - discount, 2)
             items_out.append({
                 "product_id": pid,
@@ -158,66 +227,217 @@ def agregate_results_by_id(cart: List[dict]) -> Dict[str, dict]:
             "user_id": cart.get("user_id"),
             "items": items_out
         })
+        if timed:
+            pipeline_metrics.REGISTRY.observe_cart(
+                "agregate_results_by_id", time.perf_counter() - started)
+    if discount_calls:
+        pipeline_metrics.REGISTRY.add_calls(
+            "discount_rule", discount_calls, discount_seconds)
     return result
 
 
+def price_carts(payload: Any) -> Dict[str, dict]:
+    """
+      Library entry point: normalize and price a raw {"carts": [...]}
+      payload, e.g. the body of a queue message, without touching the
+      filesystem. Carts from load_carts are already normalized; pass those
+      to agregate_results_by_id directly.
+    """
+    return agregate_results_by_id(simulate_dequeued_data(payload))
+
+
+def _price_batch(carts: List[dict], normalized: bool = False) -> List[dict]:
+    """Price one batch; normalized carts (from load_carts) skip simulate_dequeued_data."""
+    payload = {"carts": carts}
+    if not normalized:
+        payload = simulate_dequeued_data(payload)
+    return agregate_results_by_id(payload)["carts"]
+
+
+def _init_worker(metrics: Optional[Tuple[int, int]]) -> None:
+    # forked workers inherit the parent's registry; start from a clean one
+    pipeline_metrics.disable()
+    pipeline_metrics.REGISTRY.reset()
+    if metrics is not None:
+        pipeline_metrics.enable(alloc_sample_every=metrics[0], max_samples=metrics[1])
+
+
+def _price_batch_in_worker(carts: List[dict], normalized: bool) -> Tuple[List[dict], Optional[dict]]:
+    # top level so ProcessPoolExecutor can pickle it; the stage stats of the
+    # batch travel back with the result so the parent can merge them
+    priced = _price_batch(carts, normalized)
+    if not pipeline_metrics.REGISTRY.enabled:
+        return priced, None
+    return priced, pipeline_metrics.REGISTRY.drain()
+
+
+def _iter_ndjson_carts(stream: IO[bytes]) -> Iterator[dict]:
+    """Yield carts from an NDJSON stream of carts or {"carts": [...]} messages."""
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        if pipeline_metrics.REGISTRY.enabled:
+            pipeline_metrics.REGISTRY.add_bytes("stream", len(line))
+        obj = serialization.loads(line)
+        if isinstance(obj, dict) and "carts" in obj:
+            yield from obj["carts"]
+        else:
+            yield obj
+
+
+def _batched(carts: Iterable[dict], size: int) -> Iterator[List[dict]]:
+    batch: List[dict] = []
+    for cart in carts:
+        batch.append(cart)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _price_batches(batches: Iterable[List[dict]], workers: int,
+                   normalized: bool = False) -> Iterator[List[dict]]:
+    """
+      Yield priced batches in input order. With workers > 1 at most
+      2 * workers batches are in flight, so a streamed input is never read
+      far ahead of what has been written.
+    """
+    if workers <= 1:
+        for batch in batches:
+            yield _price_batch(batch, normalized)
+        return
+    # only pay for multiprocessing when it is asked for
+    from collections import deque
+    from concurrent.futures import ProcessPoolExecutor
+
+    registry = pipeline_metrics.REGISTRY
+    metrics = (registry.alloc_sample_every, registry.max_samples) if registry.enabled else None
+    pending: deque = deque()
+
+    def collect() -> List[dict]:
+        priced, stages = pending.popleft().result()
+        if stages:
+            registry.merge(stages)
+        return priced
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(metrics,)) as pool:
+        for batch in batches:
+            if len(pending) >= 2 * workers:
+                yield collect()
+            pending.append(pool.submit(_price_batch_in_worker, batch, normalized))
+        while pending:
+            yield collect()
+
+
+def run(input_path: str, output: Union[str, IO[bytes]], stream: bool = False,
+        batch_size: int = 1000, workers: int = 1) -> int:
+    """
+      Price carts from input_path ("-" for stdin) and write them as NDJSON.
+
+      stream=False reads the whole document ({"carts": [...]}, a single
+      cart, an array or NDJSON) with load_carts, which already normalizes,
+      so batches go straight to agregate_results_by_id. stream=True reads
+      NDJSON line by line and prices carts in batches of batch_size, so
+      memory stays flat on unbounded inputs. Returns the number of carts
+      written.
+    """
+    source = sys.stdin.buffer if input_path == "-" else None
+    if stream:
+        if source is None:
+            source = open(input_path, "rb")
+        try:
+            batches = _batched(_iter_ndjson_carts(source), batch_size)
+            with serialization.NDJSONWriter(output) as writer:
+                for priced in _price_batches(batches, workers):
+                    writer.write_many(priced)
+        finally:
+            if source is not sys.stdin.buffer:
+                source.close()
+        return writer.lines
+
+    carts = _decode_carts(source.read()) if source is not None else load_carts(input_path)
+    batches = _batched(carts["carts"], batch_size)
+    with serialization.NDJSONWriter(output) as writer:
+        for priced in _price_batches(batches, workers, normalized=True):
+            writer.write_many(priced)
+    return writer.lines
+
+
+def _build_parser() -> "argparse.ArgumentParser":
+    # argparse pulls in re/gettext; keep it off the library import path
+    import argparse
+    parser = argparse.ArgumentParser(
+        prog="shopping-carts",
+        description="Apply the 'buy 3, pay for 2' rule to shopping carts and write priced carts as NDJSON.")
+    parser.add_argument("input", nargs="?", default="-",
+                        help="carts file (JSON object, array or NDJSON); '-' reads stdin (default)")
+    parser.add_argument("-o", "--output", default="-",
+                        help="NDJSON output file; '-' writes stdout (default)")
+    parser.add_argument("--stream", action="store_true",
+                        help="read NDJSON line by line instead of loading the whole input")
+    parser.add_argument("--batch-size", type=int, default=1000,
+                        help="carts priced per batch (default: 1000)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="price batches in N processes (default: 1, no multiprocessing)")
+    parser.add_argument("--json-backend", choices=serialization.BACKENDS,
+                        help="force a JSON backend instead of the fastest installed one")
+    parser.add_argument("--metrics-json", metavar="PATH", default=os.environ.get("ARCA_METRICS_JSON"),
+                        help="enable stage metrics and write them as JSON (default: $ARCA_METRICS_JSON)")
+    parser.add_argument("--metrics-prom", metavar="PATH", default=os.environ.get("ARCA_METRICS_PROM"),
+                        help="enable stage metrics and write them in Prometheus text format "
+                             "(default: $ARCA_METRICS_PROM)")
+    parser.add_argument("--alloc-sample-every", type=int, metavar="N",
+                        default=pipeline_metrics.env_int("ARCA_METRICS_ALLOC_EVERY"),
+                        help="with metrics on, trace allocations during every N-th stage call; "
+                             "traced calls run several times slower, so keep N large (default: 0, off)")
+    parser.add_argument("--profile", metavar="PATH",
+                        help="dump cProfile stats for the run to PATH")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Console entry point (`shopping-carts`); returns the process exit code."""
+    args = _build_parser().parse_args(argv)
+    if args.batch_size < 1 or args.workers < 1:
+        print("shopping-carts: --batch-size and --workers must be >= 1", file=sys.stderr)
+        return 2
+    try:
+        # resolve the backend up front, whether it comes from --json-backend
+        # or ARCA_JSON_BACKEND, so a missing package is a usage error
+        if args.json_backend:
+            serialization.set_backend(args.json_backend)
+        else:
+            serialization.get_backend()
+    except (ImportError, ValueError) as exc:
+        print(f"shopping-carts: JSON backend unavailable: {exc}", file=sys.stderr)
+        return 2
+    if args.metrics_json or args.metrics_prom:
+        pipeline_metrics.enable(alloc_sample_every=args.alloc_sample_every)
+    elif pipeline_metrics.REGISTRY.enabled:
+        print("shopping-carts: ARCA_METRICS is set but no --metrics-json/--metrics-prom "
+              "(or ARCA_METRICS_JSON/ARCA_METRICS_PROM) path; metrics will not be exported",
+              file=sys.stderr)
+
+    output = sys.stdout.buffer if args.output == "-" else args.output
+    try:
+        if args.profile:
+            with pipeline_metrics.profiled(args.profile):
+                run(args.input, output, args.stream, args.batch_size, args.workers)
+        else:
+            run(args.input, output, args.stream, args.batch_size, args.workers)
+    except (OSError, ValueError) as exc:
+        print(f"shopping-carts: {exc}", file=sys.stderr)
+        return 1
+
+    if args.metrics_json:
+        pipeline_metrics.REGISTRY.write_json(args.metrics_json)
+    if args.metrics_prom:
+        pipeline_metrics.REGISTRY.write_prometheus(args.metrics_prom)
+    return 0
+
+
 if __name__ == "__main__":
-    # red-green implementation for the code
-    sample_input_cart = {
-        "carts": [
-            {
-                "cart_id": "cart-0001",
-                "user_id": "user-1001",
-                "items": [
-                    {
-                        "product_id": "prod-011",
-                        "quantity": 2,
-                        "unit_price": 3.5
-                    },
-                    {
-                        "product_id": "prod-001",
-                        "quantity": 1,
-                        "unit_price": 9.99
-                    },
-                    {
-                        "product_id": "prod-011",
-                        "quantity": 3,
-                        "unit_price": 3.5
-                    },
-                    {
-                        "product_id": "prod-001",
-                        "quantity": 1,
-                        "unit_price": 9.99
-                    }
-                ]
-            }
-        ]
-    }
-
-    sample_output_cart = {
-        "carts": [
-            {
-                "cart_id": "cart-0001",
-                "user_id": "user-1001",
-                "items": [
-                    {
-                        "product_id": "prod-011",
-                        "quantity": 5,
-                        "unit_price": 3.5,
-                        "total_price": 14.00,
-                        "discount": 3.5
-                    },
-                    {
-                        "product_id": "prod-001",
-                        "quantity": 2,
-                        "unit_price": 9.99,
-                        "total_price": 19.98,
-                        "discount": 0
-                    }
-                ]
-            }
-        ]
-    }
-
-    agrregation_result = agregate_results_by_id(sample_input_cart)
-    assert agrregation_result == sample_output_cart
+    sys.exit(main())
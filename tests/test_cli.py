@@ -0,0 +1,146 @@
+"""
+The shopping-carts entry point must be side-effect free on import, keep
+optional backends lazy and price files both loaded and streamed.
+"""
+
+import subprocess
+import sys
+import pytest
+from pathlib import Path
+
+from dsa.hash import pipeline_metrics, serialization, shopping_carts
+
+
+ROOT = Path(__file__).resolve().parents[1]
+DATA_PATH = ROOT / "data" / "shopping_carts.json"
+LAZY_MODULES = ("numpy", "orjson", "msgspec", "multiprocessing",
+                "concurrent.futures", "argparse", "cProfile", "tracemalloc", "json")
+
+
+@pytest.mark.parametrize("module", ["dsa.hash.shopping_carts", "dsa.hash.search_warehouse"])
+def test_import_is_lazy_and_silent(module):
+    code = (f"import sys, {module}; "
+            f"print(','.join(m for m in {LAZY_MODULES!r} if m in sys.modules))")
+    proc = subprocess.run([sys.executable, "-c", code], cwd=ROOT,
+                          capture_output=True, text=True, check=True)
+    assert proc.stdout == "\n"
+    assert proc.stderr == ""
+
+
+def test_main_prices_file(tmp_path):
+    out_path = tmp_path / "priced.ndjson"
+    metrics_path = tmp_path / "metrics.prom"
+    try:
+        assert shopping_carts.main([str(DATA_PATH), "-o", str(out_path),
+                                    "--metrics-prom", str(metrics_path)]) == 0
+    finally:
+        pipeline_metrics.disable()
+        pipeline_metrics.REGISTRY.reset()
+
+    expected = shopping_carts.price_carts(shopping_carts.load_data(str(DATA_PATH)))
+    assert shopping_carts.load_data(str(out_path)) == expected["carts"]
+    assert 'arca_pipeline_carts_total{stage="agregate_results_by_id"} 30' in metrics_path.read_text()
+
+
+def test_main_stream_matches_whole_file(tmp_path):
+    """
+    Streaming an NDJSON file of carts in small batches gives the same
+    priced carts as loading the whole document.
+    """
+    document = shopping_carts.load_data(str(DATA_PATH))
+    ndjson_path = tmp_path / "carts.ndjson"
+    with serialization.NDJSONWriter(str(ndjson_path)) as writer:
+        writer.write_many(document["carts"])
+    out_path = tmp_path / "priced.ndjson"
+
+    assert shopping_carts.main([str(ndjson_path), "--stream", "--batch-size", "4",
+                                "-o", str(out_path)]) == 0
+    assert shopping_carts.load_data(str(out_path)) == shopping_carts.price_carts(document)["carts"]
+
+
+def test_main_reports_missing_file(capsys):
+    assert shopping_carts.main(["does-not-exist.json"]) == 1
+    assert "does-not-exist.json" in capsys.readouterr().err
+
+
+def test_main_accepts_single_cart_object(tmp_path):
+    cart = {"cart_id": "cart-0001", "user_id": "user-1001",
+            "items": [{"product_id": "prod-011", "quantity": 3, "unit_price": 3.5}]}
+    in_path = tmp_path / "cart.json"
+    in_path.write_bytes(serialization.dumps(cart))
+    out_path = tmp_path / "priced.ndjson"
+
+    assert shopping_carts.main([str(in_path), "-o", str(out_path)]) == 0
+    # a one-line NDJSON file is also a single JSON object
+    assert [shopping_carts.load_data(str(out_path))] == shopping_carts.price_carts({"carts": [cart]})["carts"]
+
+
+def test_main_normalizes_once_and_merges_worker_metrics(tmp_path):
+    """
+    With worker processes the pricing stages still show up in the exported
+    metrics, and loaded carts are not normalized a second time per batch.
+    """
+    metrics_path = tmp_path / "metrics.json"
+    try:
+        assert shopping_carts.main([str(DATA_PATH), "-o", str(tmp_path / "priced.ndjson"),
+                                    "--batch-size", "7", "--workers", "2",
+                                    "--metrics-json", str(metrics_path)]) == 0
+    finally:
+        pipeline_metrics.disable()
+        pipeline_metrics.REGISTRY.reset()
+
+    stages = serialization.loads(metrics_path.read_bytes())["stages"]
+    assert stages["agregate_results_by_id"]["carts"] == 30
+    assert stages["agregate_results_by_id"]["calls"] == 5
+    assert stages["discount_rule"]["calls"] > 0
+    assert stages.get("simulate_dequeued_data", {"calls": 0})["calls"] <= 1
+
+
+def test_price_batches_keeps_a_bounded_window():
+    consumed = []
+
+    def batches():
+        for i in range(50):
+            consumed.append(i)
+            yield [{"cart_id": f"cart-{i}", "items": []}]
+
+    priced = shopping_carts._price_batches(batches(), workers=2)
+    first = next(priced)
+    assert first[0]["cart_id"] == "cart-0"
+    assert len(consumed) <= 2 * 2 + 1
+    rest = list(priced)
+    assert [b[0]["cart_id"] for b in rest] == [f"cart-{i}" for i in range(1, 50)]
+
+
+def test_main_exports_metrics_to_env_path(monkeypatch, tmp_path):
+    metrics_path = tmp_path / "metrics.prom"
+    monkeypatch.setenv("ARCA_METRICS_PROM", str(metrics_path))
+    try:
+        assert shopping_carts.main([str(DATA_PATH), "-o", str(tmp_path / "priced.ndjson")]) == 0
+    finally:
+        pipeline_metrics.disable()
+        pipeline_metrics.REGISTRY.reset()
+    assert "arca_pipeline_calls_total" in metrics_path.read_text()
+
+
+def test_main_reports_missing_json_backend(monkeypatch, capsys):
+    import builtins
+    real_import = builtins.__import__
+
+    def fake_import(name, *args, **kwargs):
+        if name == "msgspec":
+            raise ImportError("No module named 'msgspec'")
+        return real_import(name, *args, **kwargs)
+
+    monkeypatch.setattr(builtins, "__import__", fake_import)
+    try:
+        assert shopping_carts.main([str(DATA_PATH), "--json-backend", "msgspec"]) == 2
+        assert "msgspec" in capsys.readouterr().err
+
+        monkeypatch.setattr(serialization, "_backend", None)
+        monkeypatch.setenv("ARCA_JSON_BACKEND", "msgspec")
+        assert shopping_carts.main([str(DATA_PATH)]) == 2
+        assert "JSON backend unavailable" in capsys.readouterr().err
+    finally:
+        monkeypatch.undo()
+        serialization.set_backend(None)
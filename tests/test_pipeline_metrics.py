@@ -0,0 +1,163 @@
+"""
+Instrumentation must be invisible when disabled and report per stage
+counters, latencies and exports when enabled.
+"""
+
+import json
+import pytest
+from pathlib import Path
+import importlib.util
+
+from dsa.hash import pipeline_metrics
+
+
+MODULE_PATH = Path(__file__).resolve(
+).parents[1] / "dsa" / "hash" / "shopping_carts.py"
+DATA_PATH = Path(__file__).resolve().parents[1] / "data" / "shopping_carts.json"
+
+
+def _load_module():
+    spec = importlib.util.spec_from_file_location(
+        "shopping_carts", MODULE_PATH)
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
+
+
+@pytest.fixture
+def registry():
+    pipeline_metrics.REGISTRY.reset()
+    yield pipeline_metrics.REGISTRY
+    pipeline_metrics.disable()
+    pipeline_metrics.REGISTRY.reset()
+
+
+def test_disabled_records_nothing(registry):
+    mod = _load_module()
+    carts = mod.simulate_dequeued_data(mod.load_data(str(DATA_PATH)))
+    mod.agregate_results_by_id(carts)
+    assert registry.snapshot() == {}
+
+
+def test_enabled_records_every_stage(registry):
+    """
+    A full run over the sample dataset records calls, carts, items,
+    bytes read, per cart latency and sampled allocations.
+    """
+    mod = _load_module()
+    pipeline_metrics.enable(alloc_sample_every=1)
+    carts = mod.simulate_dequeued_data(mod.load_data(str(DATA_PATH)))
+    mod.agregate_results_by_id(carts)
+    snapshot = registry.snapshot()
+
+    assert set(snapshot) == {"load_data", "simulate_dequeued_data",
+                             "agregate_results_by_id", "discount_rule"}
+    assert snapshot["load_data"]["bytes_read"] == DATA_PATH.stat().st_size
+    assert snapshot["load_data"]["carts"] == 30
+    assert snapshot["simulate_dequeued_data"]["items"] > 0
+    agg = snapshot["agregate_results_by_id"]
+    assert agg["carts"] == 30
+    assert agg["cart_p99_seconds"] >= agg["cart_p50_seconds"] > 0
+    assert agg["alloc_samples"] == 1
+    assert snapshot["discount_rule"]["calls"] > 0
+    assert snapshot["discount_rule"]["carts"] == 0
+
+
+def test_exports(registry, tmp_path):
+    mod = _load_module()
+    pipeline_metrics.enable()
+    mod.agregate_results_by_id({"carts": [{"cart_id": "c", "user_id": "u", "items": [
+        {"product_id": "p", "quantity": 3, "unit_price": 1.0}]}]})
+
+    json_path = tmp_path / "metrics.json"
+    prom_path = tmp_path / "metrics.prom"
+    registry.write_json(str(json_path))
+    registry.write_prometheus(str(prom_path))
+
+    exported = json.loads(json_path.read_text())
+    assert exported["stages"]["agregate_results_by_id"]["items"] == 1
+    prom = prom_path.read_text()
+    assert "# TYPE arca_pipeline_calls_total counter" in prom
+    assert 'arca_pipeline_carts_total{stage="agregate_results_by_id"} 1' in prom
+
+    profile_path = tmp_path / "run.prof"
+    with pipeline_metrics.profiled(str(profile_path)):
+        mod.discount_rule(quantity=3, unity_price=1.0)
+    assert profile_path.stat().st_size > 0
+
+
+def test_nested_stage_keeps_outer_alloc_peak():
+    """An inner stage must not reset the peak of a sampled outer stage."""
+    local = pipeline_metrics.MetricsRegistry()
+
+    @pipeline_metrics.stage("inner", counter=None, registry=local)
+    def inner():
+        return 0
+
+    @pipeline_metrics.stage("outer", counter=None, registry=local)
+    def outer():
+        block = bytearray(1 << 20)
+        del block
+        return inner()
+
+    local.enable(alloc_sample_every=1)
+    try:
+        outer()
+    finally:
+        local.disable()
+    assert local.stages["outer"].alloc_peak_bytes >= 1 << 20
+    assert local.stages["inner"].alloc_samples == 0
+
+
+def test_disable_keeps_caller_tracemalloc_session():
+    import tracemalloc
+    tracemalloc.start()
+    try:
+        local = pipeline_metrics.MetricsRegistry()
+        local.enable(alloc_sample_every=1)
+        local.disable()
+        assert tracemalloc.is_tracing()
+    finally:
+        tracemalloc.stop()
+
+
+@pytest.mark.parametrize("samples, pct, expected", [
+    (range(1, 6), 50, 3),
+    (range(1, 151), 99, 149),
+    (range(1, 2), 99, 1),
+])
+def test_percentile_is_nearest_rank(samples, pct, expected):
+    stats = pipeline_metrics.StageStats("s")
+    stats.cart_seconds.extend(samples)
+    assert stats.percentile(pct) == expected
+
+
+def test_alloc_sampling_traces_only_sampled_calls():
+    import tracemalloc
+    local = pipeline_metrics.MetricsRegistry()
+    seen = []
+
+    @pipeline_metrics.stage("s", counter=None, registry=local)
+    def work():
+        seen.append(tracemalloc.is_tracing())
+
+    local.enable(alloc_sample_every=2)
+    try:
+        for _ in range(4):
+            work()
+    finally:
+        local.disable()
+    assert seen == [False, True, False, True]
+    assert not tracemalloc.is_tracing()
+    assert local.stages["s"].alloc_samples == 2
+
+
+def test_bad_env_does_not_break_import():
+    import os
+    import subprocess
+    import sys
+    env = dict(os.environ, ARCA_METRICS="1", ARCA_METRICS_ALLOC_EVERY="lots")
+    proc = subprocess.run([sys.executable, "-c", "import dsa.hash.shopping_carts"],
+                          cwd=Path(__file__).resolve().parents[1], env=env,
+                          capture_output=True, text=True)
+    assert proc.returncode == 0, proc.stderr
@@ -0,0 +1,136 @@
+"""
+The serialization layer must give the same results on every backend and
+the NDJSON writer must round-trip through load_data.
+"""
+
+import importlib.util
+import io
+import json
+import pytest
+from pathlib import Path
+
+from dsa.hash import serialization
+
+
+MODULE_PATH = Path(__file__).resolve(
+).parents[1] / "dsa" / "hash" / "shopping_carts.py"
+DATA_PATH = Path(__file__).resolve().parents[1] / "data" / "shopping_carts.json"
+
+
+def _load_module():
+    spec = importlib.util.spec_from_file_location(
+        "shopping_carts", MODULE_PATH)
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
+
+
+def _available_backends():
+    names = []
+    for name in serialization.BACKENDS:
+        try:
+            serialization._import_backend(name)
+            names.append(name)
+        except ImportError:
+            pass
+    return names
+
+
+@pytest.fixture(params=_available_backends())
+def backend(request):
+    yield serialization.set_backend(request.param)
+    serialization.set_backend(None)
+
+
+def test_roundtrip_matches_stdlib(backend):
+    document = json.loads(DATA_PATH.read_text(encoding="utf-8"))
+    encoded = serialization.dumps(document)
+    assert isinstance(encoded, bytes)
+    assert serialization.loads(encoded) == document
+
+
+def test_load_carts_matches_simulate_dequeued_data(backend):
+    mod = _load_module()
+    expected = mod.simulate_dequeued_data(mod.load_data(str(DATA_PATH)))
+    assert mod.load_carts(str(DATA_PATH)) == expected
+
+
+def test_unknown_backend_is_rejected():
+    with pytest.raises(ValueError):
+        serialization.set_backend("yaml")
+
+
+def test_ndjson_writer_roundtrip(backend, tmp_path):
+    """
+    Priced carts written as NDJSON, with a buffer small enough to force
+    several flushes, are read back unchanged by load_data.
+    """
+    mod = _load_module()
+    priced = mod.agregate_results_by_id(mod.load_carts(str(DATA_PATH)))
+    out_path = tmp_path / "priced.ndjson"
+
+    lines = serialization.write_priced_carts(str(out_path), priced, buffer_size=256)
+
+    assert lines == len(priced["carts"])
+    assert mod.load_data(str(out_path)) == priced["carts"]
+
+
+def test_ndjson_writer_leaves_stream_open(backend):
+    stream = io.BytesIO()
+    with serialization.NDJSONWriter(stream) as writer:
+        writer.write({"cart_id": "cart-0001"})
+    assert not stream.closed
+    assert stream.getvalue().splitlines() == [serialization.dumps({"cart_id": "cart-0001"})]
+
+
+EDGE_CASES = {
+    "id_user_aliases": {"carts": [{"id": "c1", "user": "u1",
+                                   "items": [{"product_id": "p", "quantity": 3, "unit_price": 1.5}]}]},
+    "string_numbers": {"carts": [{"cart_id": "c1", "items": [
+        {"product_id": "p", "quantity": "3", "unit_price": "1.5"}]}]},
+    "null_quantity": {"carts": [{"cart_id": "c1", "items": [
+        {"product_id": "p", "quantity": None, "unit_price": 1.5},
+        {"product_id": "q", "quantity": 2, "unit_price": 1.0}]}]},
+    "items_as_dict": {"carts": [{"cart_id": "c1",
+                                 "items": {"product_id": "p", "quantity": 1, "unit_price": 2.0}}]},
+    "integer_ids": {"carts": [{"cart_id": 7, "user_id": 8,
+                               "items": [{"product_id": 11, "quantity": 1, "unit_price": 2.0}]}]},
+    "non_dict_cart": {"carts": ["oops", {"cart_id": "c1", "items": []}]},
+    "bare_array": [{"cart_id": "c1", "items": [{"product_id": "p", "quantity": 4, "unit_price": 1.0}]}],
+}
+
+
+@pytest.mark.parametrize("case", sorted(EDGE_CASES))
+def test_load_carts_edge_cases_match_on_every_backend(backend, case, tmp_path):
+    """
+    Off-schema documents give the same carts as the lenient
+    simulate_dequeued_data, whatever backend is installed.
+    """
+    mod = _load_module()
+    document = EDGE_CASES[case]
+    path = tmp_path / "carts.json"
+    path.write_text(json.dumps(document), encoding="utf-8")
+    wrapped = {"carts": document} if isinstance(document, list) else document
+
+    assert mod.load_carts(str(path)) == mod.simulate_dequeued_data(wrapped)
+
+
+def test_typed_decode_falls_back_off_schema():
+    pytest.importorskip("msgspec")
+    serialization.set_backend("msgspec")
+    try:
+        assert serialization.decode_carts(
+            b'{"carts": [{"cart_id": "c", "items": [{"product_id": "p", "quantity": "two"}]}]}') is None
+        assert serialization.decode_carts(b'{"cart_id": "c", "items": []}') is None
+        assert serialization.decode_carts(b'{"carts": []}\n{"carts": []}\n') is None
+    finally:
+        serialization.set_backend(None)
+
+
+def test_ndjson_writer_backend_error_opens_nothing(monkeypatch, tmp_path):
+    monkeypatch.setattr(serialization, "_backend", None)
+    monkeypatch.setenv("ARCA_JSON_BACKEND", "yaml")
+    out_path = tmp_path / "priced.ndjson"
+    with pytest.raises(ValueError):
+        serialization.NDJSONWriter(str(out_path))
+    assert not out_path.exists()